@@ -1,20 +1,24 @@
-from datetime import datetime
-from typing import List, Optional
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Literal, Optional, Union
 from fastapi import FastAPI, HTTPException, Query, Path
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, GetCoreSchemaHandler, model_validator
-from pydantic.json_schema import JsonSchemaValue
-from pydantic_core import core_schema
-from motor.motor_asyncio import AsyncIOMotorClient
-from bson import ObjectId
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from pymongo import TEXT, AsyncMongoClient, IndexModel, InsertOne, ReturnDocument, UpdateMany
+import orjson
 import os
 from dotenv import load_dotenv
-import random
+import itertools
+import logging
 
 # Load environment variables
 load_dotenv()
 
-# Placeholder for random icons (you can replace these with actual paths/URLs)
+logger = logging.getLogger(__name__)
+
+# Placeholder for default icons (you can replace these with actual paths/URLs)
 DEFAULT_ICONS = [
     "https://api.iconify.design/material-symbols:lightbulb-outline.svg",
     "https://api.iconify.design/material-symbols:handshake-outline.svg",
@@ -22,6 +26,85 @@ DEFAULT_ICONS = [
     "https://api.iconify.design/material-symbols:support-agent-outline.svg",
     "https://api.iconify.design/material-symbols:security-outline.svg",
 ]
+# Topics created without an icon take the default icons in turn
+default_icon_cycle = itertools.cycle(DEFAULT_ICONS)
+
+# MongoDB connection
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+client = AsyncMongoClient(
+    MONGODB_URL,
+    maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+    minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", "10")),  # Keep warm connections for the first requests
+    compressors=os.getenv("MONGODB_COMPRESSORS", "zstd,zlib"),
+    serverSelectionTimeoutMS=2000,
+    retryWrites=True,
+    appname="help-center",  # Identifies this service in server logs and the profiler
+    tz_aware=True,  # Read dates back as aware UTC datetimes, like the ones we write
+)
+db = client.help_center
+
+async def backfill_tip_counts():
+    """Store tipCount on topics created before it was kept on the topic document."""
+    async for topic in db.topics.find({"tipCount": {"$exists": False}}, {"topic_id": 1}):
+        tip_count = await db.tips.count_documents({"topic_id": topic["topic_id"]})
+        await db.topics.update_one({"_id": topic["_id"]}, {"$set": {"tipCount": tip_count}})
+
+async def seed_counter(name: str, collection, field: str, start: int):
+    """Make sure counter `name` is at least the highest `field` already stored in `collection`."""
+    # Projecting only the indexed field lets the unique index cover this query
+    last = await collection.find_one({}, projection={field: 1, "_id": 0}, sort=[(field, -1)])
+    await db.counters.update_one(
+        {"_id": name},
+        {"$max": {"seq": last[field] if last else start}},
+        upsert=True
+    )
+
+async def next_sequence(name: str) -> int:
+    """Atomically increment counter `name` and return its new value."""
+    counter = await db.counters.find_one_and_update(
+        {"_id": name},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def ensure_indexes():
+    """Create the indexes the routes rely on; runs once per process at startup."""
+    # Text indexes back /api/search; a title hit outweighs a description hit.
+    # The id suffixes give paginated display_order sorts a unique tie-breaker;
+    # (topic_id, display_order, tip_id) also serves plain topic_id filters on tips.
+    await db.topics.create_indexes([
+        IndexModel("topic_id", unique=True),
+        IndexModel([("display_order", 1), ("topic_id", 1)]),
+        IndexModel(
+            [("title", TEXT), ("description", TEXT)],
+            weights={"title": 10, "description": 1},
+            name="topics_text",
+        ),
+    ])
+    await db.tips.create_indexes([
+        IndexModel("tip_id", unique=True),
+        IndexModel([("topic_id", 1), ("display_order", 1), ("tip_id", 1)]),
+        IndexModel(
+            [("title", TEXT), ("description", TEXT)],
+            weights={"title": 10, "description": 1},
+            name="tips_text",
+        ),
+    ])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the first pooled connection before serving; fails fast if MongoDB is unreachable
+    await db.command("ping")
+    await ensure_indexes()
+    # Id counters pick up where existing data left off (topics start at 1, tips at 2001)
+    await seed_counter("topic_id", db.topics, "topic_id", 0)
+    await seed_counter("tip_id", db.tips, "tip_id", 2000)
+    await backfill_tip_counts()
+    # Build the cached OpenAPI schema now rather than on the first /docs request
+    app.openapi()
+    yield
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -30,42 +113,63 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allows all origins
     allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods (GET, POST, PUT, DELETE, etc.)
-    allow_headers=["*"],  # Allows all headers
+    allow_methods=["GET", "POST", "DELETE"],  # The methods the API exposes
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=3600,  # Let browsers reuse preflight responses for an hour
 )
 
-# MongoDB connection
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(MONGODB_URL)
-db = client.help_center
+# The internal _id isn't part of any response model, so list reads don't fetch it
+LIST_PROJECTION = {"_id": 0}
+
+def utc_now() -> datetime:
+    # BSON dates hold milliseconds; truncate so echoed values match what a later read returns
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+# OpenAPI examples for the request/response models
+TIP_CREATE_EXAMPLE = {
+    "tip_id": 2001,  # Optional for creation, required for update
+    "title": "How to create a new project",
+    "description": "To create a new project, click the '+' button in the top right corner...",
+    "media": {
+        "type": "image",
+        "url": "https://example.com/image.jpg",
+        "alt_text": "Screenshot of the dashboard"
+    },
+    "display_order": 1,
+    "topic_id": 1001
+}
+TIP_EXAMPLE = {
+    **TIP_CREATE_EXAMPLE,
+    "created_at": "2024-03-15T10:30:00",
+    "updated_at": "2024-03-15T10:30:00"
+}
+TOPIC_CREATE_EXAMPLE = {
+    "title": "Project Management",
+    "description": "Tips and tricks for managing projects effectively",
+    "display_order": 1,
+    "isNew": True,
+    "icon": ""
+}
+TOPIC_EXAMPLE = {
+    "topic_id": 1001,
+    "title": "Project Management",
+    "description": "Tips and tricks for managing projects effectively",
+    "created_at": "2024-03-15T10:30:00",
+    "updated_at": "2024-03-15T10:30:00",
+    "tipCount": 1
+}
 
 # Pydantic models
-class PyObjectId(ObjectId):
-    @classmethod
-    def __get_pydantic_core_schema__(cls, source_type, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
-        return core_schema.no_info_after_validator_function(
-            cls.validate,
-            core_schema.str_schema(),
-            serialization=core_schema.plain_serializer_function_ser_schema(str),
-        )
-
-    @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid ObjectId")
-        return ObjectId(v)
-
-    @classmethod
-    def __get_pydantic_json_schema__(cls, core_schema: core_schema.CoreSchema, handler) -> JsonSchemaValue:
-        return {"type": "string", "examples": ["507f1f77bcf86cd799439011"]}
-
 class Media(BaseModel):
     type: str = Field(..., description="Type of media (image or video)", example="image")
     url: str = Field(..., description="URL of the media", example="https://example.com/image.jpg")
@@ -81,44 +185,12 @@ class TipBase(BaseModel):
 
 class TipCreate(TipBase):
     tip_id: Optional[int] = Field(None, description="Unique integer ID for the tip (required for update, optional for creation)", example=2001)
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "tip_id": 2001,
-                "title": "How to create a new project",
-                "description": "To create a new project, click the '+' button in the top right corner...",
-                "media": {
-                    "type": "image",
-                    "url": "https://example.com/image.jpg",
-                    "alt_text": "Screenshot of the dashboard"
-                },
-                "display_order": 1,
-                "topic_id": 1001,
-                "tip_id": 2001  # Optional for creation, required for update
-            }
-        }
+    model_config = ConfigDict(json_schema_extra={"example": TIP_CREATE_EXAMPLE})
 
 class Tip(TipBase):
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-    class Config:
-        populate_by_name = True
-        json_schema_extra = {
-            "example": {
-                "tip_id": 2001,
-                "title": "How to create a new project",
-                "description": "To create a new project, click the '+' button in the top right corner...",
-                "media": {
-                    "type": "image",
-                    "url": "https://example.com/image.jpg",
-                    "alt_text": "Screenshot of the dashboard"
-                },
-                "display_order": 1,
-                "topic_id": 1001,
-                "created_at": "2024-03-15T10:30:00",
-                "updated_at": "2024-03-15T10:30:00"
-            }
-        }
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
+    model_config = ConfigDict(populate_by_name=True, json_schema_extra={"example": TIP_EXAMPLE})
 
 class TopicBase(BaseModel):
     title: str = Field(..., description="Title of the topic", example="Project Management")
@@ -134,38 +206,21 @@ class TopicCreate(TopicBase):
     @classmethod
     def set_random_icon_if_none(cls, values):
         if not values.get('icon'):
-            values['icon'] = random.choice(DEFAULT_ICONS)
+            values['icon'] = next(default_icon_cycle)
         return values
 
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "title": "Project Management",
-                "description": "Tips and tricks for managing projects effectively",
-                "display_order": 1,
-                "isNew": True,
-                "icon": ""
-            }
-        }
+    model_config = ConfigDict(json_schema_extra={"example": TOPIC_CREATE_EXAMPLE})
 
 class Topic(TopicBase):
     topic_id: int = Field(..., description="Unique integer ID for the topic", example=1001)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
     tipCount: int = Field(default=0, description="Number of tips in this topic", example=5)
 
-    class Config:
-        populate_by_name = True
-        json_schema_extra = {
-            "example": {
-                "topic_id": 1001,
-                "title": "Project Management",
-                "description": "Tips and tricks for managing projects effectively",
-                "created_at": "2024-03-15T10:30:00",
-                "updated_at": "2024-03-15T10:30:00",
-                "tipCount": 1
-            }
-        }
+    model_config = ConfigDict(populate_by_name=True, json_schema_extra={"example": TOPIC_EXAMPLE})
+
+class TopicWithTips(Topic):
+    tips: List[Tip] = Field(default_factory=list, description="Tips in this topic, sorted by display_order")
 
 class SearchResult(BaseModel):
     type: str = Field(..., description="Type of result (topic or tip)", example="tip")
@@ -183,6 +238,20 @@ class SearchResponse(BaseModel):
     limit: int
     offset: int
 
+def tip_from_doc(doc: dict) -> Tip:
+    """Build a Tip from a trusted MongoDB document without re-running validation."""
+    if doc.get("media") is not None:
+        doc["media"] = Media.model_construct(**doc["media"])
+    return Tip.model_construct(**doc)
+
+async def stream_ndjson(cursor):
+    """Yield each document from `cursor` as one line of NDJSON."""
+    try:
+        async for doc in cursor:
+            yield orjson.dumps(doc, option=orjson.OPT_UTC_Z) + b"\n"
+    finally:
+        await cursor.close()
+
 # API Routes
 @app.post("/api/topics", response_model=Topic, status_code=201, tags=["Topics"])
 async def create_or_update_topic(topic: TopicCreate):
@@ -190,107 +259,149 @@ async def create_or_update_topic(topic: TopicCreate):
     Create a new topic or update an existing one.
     If topic_id is provided and exists, the topic will be updated.
     If topic_id is not provided or doesn't exist, a new topic will be created.
+    A topic_id that was allocated before (e.g. to a deleted topic) can't be reused (409).
     
     - **topic_id**: Unique integer ID for the topic (optional for creation, required for update)
     - **title**: Title of the topic
     - **description**: Optional description of the topic
     """
+    now = utc_now()
     topic_dict = topic.model_dump()
     if topic.topic_id:
-        # Check if topic_id exists for update
-        existing = await db.topics.find_one({"topic_id": topic.topic_id})
+        # Update the topic; the pre-update document supplies the original display_order
+        topic_dict["updated_at"] = now
+        existing = await db.topics.find_one_and_update(
+            {"topic_id": topic.topic_id},
+            {"$set": topic_dict},
+            return_document=ReturnDocument.BEFORE
+        )
         if not existing:
-            raise HTTPException(status_code=404, detail="Topic not found")
-        
+            # Create the topic under the given topic_id. Claim the id on the counter first:
+            # $max only hands it to us if no generated or previously claimed id has reached
+            # it, so neither next_sequence nor a concurrent request can end up with it too.
+            counter = await db.counters.find_one_and_update(
+                {"_id": "topic_id"},
+                {"$max": {"seq": topic.topic_id}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+            if counter and counter["seq"] >= topic.topic_id:
+                raise HTTPException(status_code=409, detail="topic_id has already been allocated")
+
+            topic_dict["created_at"] = now
+            topic_dict["tipCount"] = 0
+            # Make room at the new topic's display_order, then insert it
+            await db.topics.bulk_write([
+                UpdateMany(
+                    {"display_order": {"$gte": topic_dict["display_order"]}},
+                    {"$inc": {"display_order": 1}}
+                ),
+                InsertOne(topic_dict)
+            ], ordered=True)
+            return Topic.model_construct(**topic_dict)
+
         original_display_order = existing.get("display_order")
         new_display_order = topic_dict.get("display_order")
 
+        # The shift filters exclude the target topic, so they run after its update
+        writes = []
         if new_display_order is not None and new_display_order != original_display_order:
             # Adjust display_order of other topics
             if new_display_order > original_display_order:
                 # Moving to a higher display_order (down the list)
-                await db.topics.update_many(
+                writes.append(db.topics.update_many(
                     {
                         "topic_id": {"$ne": topic.topic_id},
                         "display_order": {"$gt": original_display_order, "$lte": new_display_order}
                     },
                     {"$inc": {"display_order": -1}}
-                )
+                ))
             elif new_display_order < original_display_order:
                 # Moving to a lower display_order (up the list)
-                await db.topics.update_many(
+                writes.append(db.topics.update_many(
                     {
                         "topic_id": {"$ne": topic.topic_id},
                         "display_order": {"$gte": new_display_order, "$lt": original_display_order}
                     },
                     {"$inc": {"display_order": 1}}
-                )
+                ))
 
-        # Update existing topic
-        topic_dict["updated_at"] = datetime.utcnow()
-        await db.topics.update_one(
-            {"topic_id": topic.topic_id},
-            {"$set": topic_dict}
-        )
-        updated_topic = await db.topics.find_one({"topic_id": topic.topic_id})
-        # Calculate tipCount for the updated topic
-        tip_count = await db.tips.count_documents({"topic_id": updated_topic["topic_id"]})
-        updated_topic["tipCount"] = tip_count
-        return Topic(**updated_topic)
+        await asyncio.gather(*writes)
+        return Topic.model_construct(**{**existing, **topic_dict})
     else:
         # Create new topic with app-generated topic_id
-        # Find the maximum topic_id to assign the next available one
-        max_topic = await db.topics.find_one(
-            {}, sort=[("topic_id", -1)]
-        )
-        next_topic_id = (max_topic["topic_id"] + 1) if max_topic else 1 # Start from 1 if no topics exist
-        
+        next_topic_id = await next_sequence("topic_id")
+
         topic_dict["topic_id"] = next_topic_id
-        topic_dict["created_at"] = datetime.utcnow()
-        topic_dict["updated_at"] = datetime.utcnow()
+        topic_dict["created_at"] = now
+        topic_dict["updated_at"] = now
+        # tipCount is stored on the topic and kept up to date by the tip endpoints
+        topic_dict["tipCount"] = 0
         
         # Handle display_order for new topics
+        writes = []
         if "display_order" in topic_dict and topic_dict["display_order"] is not None:
             # User explicitly provided a display_order, shift existing topics
-            await db.topics.update_many(
+            writes.append(UpdateMany(
                 {"display_order": {"$gte": topic_dict["display_order"]}},
                 {"$inc": {"display_order": 1}}
-            )
+            ))
         else:
             # Assign display_order as the count of existing topics if not provided by user
             topic_count = await db.topics.count_documents({})
             topic_dict["display_order"] = topic_count
 
-        # Debugging: Print topic_dict before insertion to check icon value
-        print(f"Topic dict before insertion: {topic_dict}")
+        logger.debug("Topic dict before insertion: %s", topic_dict)
 
-        await db.topics.insert_one(topic_dict)
-        created_topic = await db.topics.find_one({"topic_id": next_topic_id})
-        # Initialize tipCount for the new topic
-        created_topic["tipCount"] = 0
-        return Topic(**created_topic)
+        # Shift and insert in one ordered batch so the shift always lands first
+        writes.append(InsertOne(topic_dict))
+        await db.topics.bulk_write(writes, ordered=True)
+        return Topic.model_construct(**topic_dict)
 
 @app.get("/api/topics", response_model=List[Topic], tags=["Topics"])
-async def get_topics():
-    topics_cursor = db.topics.find().sort("display_order", 1)
-    topics_list = []
-    async for t in topics_cursor:
-        tip_count = await db.tips.count_documents({"topic_id": t["topic_id"]})
-        t["tipCount"] = tip_count
-        topics_list.append(Topic(**t))
-    return topics_list
-
-@app.get("/api/topics/{topic_id}", response_model=Topic, tags=["Topics"])
-async def get_topic(topic_id: int = Path(..., description="The topic_id of the topic to retrieve")):
-    topic = await db.topics.find_one({"topic_id": topic_id})
-    if not topic:
+async def get_topics(
+    limit: int = Query(100, ge=1, le=500, description="Maximum number of topics to return"),
+    offset: int = Query(0, ge=0, description="Number of topics to skip")
+):
+    topics = await db.topics.find(
+        {}, LIST_PROJECTION
+    ).sort([("display_order", 1), ("topic_id", 1)]).skip(offset).limit(limit).to_list(length=limit)
+    return [Topic.model_construct(**t) for t in topics]
+
+@app.get("/api/topics/{topic_id}", response_model=Union[TopicWithTips, Topic], tags=["Topics"])
+async def get_topic(
+    topic_id: int = Path(..., description="The topic_id of the topic to retrieve"),
+    expand: Optional[Literal["tips"]] = Query(None, description="Set to 'tips' to embed the topic's tips")
+):
+    """
+    Retrieve a topic. Its tips are only included when requested with `?expand=tips`.
+    """
+    if expand != "tips":
+        topic = await db.topics.find_one({"topic_id": topic_id})
+        if not topic:
+            raise HTTPException(status_code=404, detail="Topic not found")
+        return Topic.model_construct(**topic)
+
+    # Join the tips in the same round trip as the topic
+    cursor = await db.topics.aggregate([
+        {"$match": {"topic_id": topic_id}},
+        {"$lookup": {
+            "from": "tips",
+            "let": {"topic_id": "$topic_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$topic_id", "$$topic_id"]}}},
+                {"$sort": {"display_order": 1}},
+                {"$project": LIST_PROJECTION},
+            ],
+            "as": "tips",
+        }},
+    ])
+    topics = await cursor.to_list(length=1)
+    if not topics:
         raise HTTPException(status_code=404, detail="Topic not found")
-    
-    # Calculate tipCount for the retrieved topic
-    tip_count = await db.tips.count_documents({"topic_id": topic["topic_id"]})
-    topic["tipCount"] = tip_count
-    
-    return Topic(**topic)
+    topic = topics[0]
+    tips = [tip_from_doc(t) for t in topic.pop("tips")]
+    return TopicWithTips.model_construct(**topic, tips=tips)
 
 @app.delete("/api/topics/{topic_id}", status_code=204, tags=["Topics"])
 async def delete_topic(topic_id: int = Path(..., description="The topic_id of the topic to delete")):
@@ -314,197 +425,241 @@ async def create_or_update_tip(tip: TipCreate):
     - **display_order**: Order in which the tip should be displayed
     """
     # Verify topic exists
-    topic = await db.topics.find_one({"topic_id": tip.topic_id})
+    topic = await db.topics.find_one({"topic_id": tip.topic_id}, projection={"_id": 1})
     if not topic:
         raise HTTPException(status_code=404, detail="Topic not found")
 
+    now = utc_now()
     tip_dict = tip.model_dump()
     
     if tip.tip_id is not None:
-        # Update existing tip
-        existing = await db.tips.find_one({"tip_id": tip.tip_id})
+        # Update existing tip; the pre-update document doubles as the existence
+        # check and supplies the original display_order and topic
+        tip_dict["updated_at"] = now
+        existing = await db.tips.find_one_and_update(
+            {"tip_id": tip.tip_id},
+            {"$set": tip_dict},
+            return_document=ReturnDocument.BEFORE
+        )
         if not existing:
             raise HTTPException(status_code=404, detail="Tip not found")
-        
+
         original_display_order = existing.get("display_order")
         new_display_order = tip_dict.get("display_order")
 
+        # The follow-up writes all touch other documents, so they run concurrently
+        writes = []
         if new_display_order is not None and new_display_order != original_display_order:
             # Adjust display_order of other tips within the same topic
             if new_display_order > original_display_order:
                 # Moving to a higher display_order (down the list)
-                await db.tips.update_many(
+                writes.append(db.tips.update_many(
                     {
                         "topic_id": tip.topic_id,
                         "tip_id": {"$ne": tip.tip_id},
                         "display_order": {"$gt": original_display_order, "$lte": new_display_order}
                     },
                     {"$inc": {"display_order": -1}}
-                )
+                ))
             elif new_display_order < original_display_order:
                 # Moving to a lower display_order (up the list)
-                await db.tips.update_many(
+                writes.append(db.tips.update_many(
                     {
                         "topic_id": tip.topic_id,
                         "tip_id": {"$ne": tip.tip_id},
                         "display_order": {"$gte": new_display_order, "$lt": original_display_order}
                     },
                     {"$inc": {"display_order": 1}}
-                )
+                ))
 
-        tip_dict["updated_at"] = datetime.utcnow()
-        await db.tips.update_one(
-            {"tip_id": tip.tip_id},
-            {"$set": tip_dict}
-        )
-        updated_tip = await db.tips.find_one({"tip_id": tip.tip_id})
-        return Tip(**updated_tip)
+        if existing["topic_id"] != tip.topic_id:
+            # The tip moves to another topic; keep both stored tip counts in step
+            writes.append(db.topics.update_one({"topic_id": existing["topic_id"]}, {"$inc": {"tipCount": -1}}))
+            writes.append(db.topics.update_one({"topic_id": tip.topic_id}, {"$inc": {"tipCount": 1}}))
+
+        await asyncio.gather(*writes)
+        return tip_from_doc({**existing, **tip_dict})
     else:
         # Create new tip
-        # Generate a new tip_id (you might want to implement a more sophisticated ID generation)
-        last_tip = await db.tips.find_one(sort=[("tip_id", -1)])
-        new_tip_id = (last_tip["tip_id"] + 1) if last_tip else 2001
-        
+        new_tip_id = await next_sequence("tip_id")
+
         tip_dict["tip_id"] = new_tip_id
-        tip_dict["created_at"] = datetime.utcnow()
-        tip_dict["updated_at"] = datetime.utcnow()
+        tip_dict["created_at"] = now
+        tip_dict["updated_at"] = now
         
         # Handle display_order for new tips
+        writes = []
         if "display_order" in tip_dict and tip_dict["display_order"] is not None:
             # User explicitly provided a display_order, shift existing tips in this topic
-            await db.tips.update_many(
+            writes.append(UpdateMany(
                 {
                     "topic_id": tip.topic_id,
                     "display_order": {"$gte": tip_dict["display_order"]}
                 },
                 {"$inc": {"display_order": 1}}
-            )
+            ))
         else:
             # Assign display_order as the count of existing tips in this topic if not provided by user
             tip_count = await db.tips.count_documents({"topic_id": tip.topic_id})
             tip_dict["display_order"] = tip_count
 
-        await db.tips.insert_one(tip_dict)
-        created_tip = await db.tips.find_one({"tip_id": new_tip_id})
-        return Tip(**created_tip)
+        # Shift and insert in one ordered batch so the shift always lands first
+        writes.append(InsertOne(tip_dict))
+        await db.tips.bulk_write(writes, ordered=True)
+        await db.topics.update_one({"topic_id": tip.topic_id}, {"$inc": {"tipCount": 1}})
+        return tip_from_doc(tip_dict)
 
 @app.get("/api/topics/{topic_id}/tips", response_model=List[Tip], tags=["Tips"])
-async def get_tips_by_topic(topic_id: int = Path(..., description="The topic_id to get tips for")):
-    tips = await db.tips.find({"topic_id": topic_id}).sort("display_order", 1).to_list(length=None)
-    return [Tip(**t) for t in tips]
+async def get_tips_by_topic(
+    topic_id: int = Path(..., description="The topic_id to get tips for"),
+    limit: int = Query(100, ge=1, le=500, description="Maximum number of tips to return"),
+    offset: int = Query(0, ge=0, description="Number of tips to skip")
+):
+    tips = await db.tips.find(
+        {"topic_id": topic_id}, LIST_PROJECTION
+    ).sort([("display_order", 1), ("tip_id", 1)]).skip(offset).limit(limit).to_list(length=limit)
+    return [tip_from_doc(t) for t in tips]
+
+@app.get("/api/topics/{topic_id}/tips.ndjson", response_class=StreamingResponse, tags=["Tips"])
+async def stream_tips_by_topic(topic_id: int = Path(..., description="The topic_id to get tips for")):
+    """
+    Stream the tips of a topic as newline-delimited JSON, sorted by display_order.
+    """
+    cursor = db.tips.find({"topic_id": topic_id}, LIST_PROJECTION).sort("display_order", 1)
+    return StreamingResponse(stream_ndjson(cursor), media_type="application/x-ndjson")
 
 @app.get("/api/tips/{tip_id}", response_model=Tip, tags=["Tips"])
 async def get_tip(tip_id: int = Path(..., description="The tip_id of the tip to retrieve")):
     tip = await db.tips.find_one({"tip_id": tip_id})
     if not tip:
         raise HTTPException(status_code=404, detail="Tip not found")
-    return Tip(**tip)
+    return tip_from_doc(tip)
 
 @app.delete("/api/tips/{tip_id}", status_code=204, tags=["Tips"])
 async def delete_tip(tip_id: int = Path(..., description="The tip_id of the tip to delete")):
-    result = await db.tips.delete_one({"tip_id": tip_id})
-    if result.deleted_count == 0:
+    deleted = await db.tips.find_one_and_delete({"tip_id": tip_id}, projection={"topic_id": 1})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Tip not found")
+    await db.topics.update_one({"topic_id": deleted["topic_id"]}, {"$inc": {"tipCount": -1}})
 
 @app.get("/api/tips", response_model=List[Tip], tags=["Tips"])
 async def get_all_tips():
     """
     Retrieve a list of all tips, sorted by display_order.
     """
-    tips = await db.tips.find().sort("display_order", 1).to_list(length=None)
-    return [Tip(**t) for t in tips]
+    tips = await db.tips.find({}, LIST_PROJECTION).sort("display_order", 1).to_list(length=None)
+    return [tip_from_doc(t) for t in tips]
+
+@app.get("/api/tips.ndjson", response_class=StreamingResponse, tags=["Tips"])
+async def stream_all_tips():
+    """
+    Stream all tips as newline-delimited JSON, sorted by display_order.
+    Unlike /api/tips, documents are sent as they are read instead of being buffered.
+    """
+    cursor = db.tips.find({}, LIST_PROJECTION).sort("display_order", 1)
+    return StreamingResponse(stream_ndjson(cursor), media_type="application/x-ndjson")
 
 @app.get("/api/search", response_model=SearchResponse, tags=["Search"])
 async def search(
     q: str = Query(..., description="Search query string"),
-    limit: int = Query(20, description="Maximum number of results to return"),
-    offset: int = Query(0, description="Number of results to skip")
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return"),
+    offset: int = Query(0, ge=0, description="Number of results to skip")
 ):
     """
-    Search across topics and tips with partial matching.
+    Full-text search across topics and tips, ranked by MongoDB text score.
     
     - **q**: Search query string
     - **limit**: Maximum number of results to return (default: 20)
     - **offset**: Number of results to skip (default: 0)
     """
-    # Use regex for partial matching
-    search_query = {
-        "$or": [
-            {"title": {"$regex": q, "$options": "i"}},
-            {"description": {"$regex": q, "$options": "i"}}
-        ]
-    }
-    
-    # Search in topics
-    topic_results = await db.topics.find(
-        search_query
-    ).skip(offset).limit(limit).to_list(length=None)
-    
-    # Search in tips
-    tip_results = await db.tips.find(
-        search_query
-    ).skip(offset).limit(limit).to_list(length=None)
-    
-    # Combine and format results
-    results = []
-    
-    for topic in topic_results:
-        # Calculate a simple relevance score based on match position
-        title_match = topic["title"].lower().find(q.lower())
-        desc_match = topic.get("description", "").lower().find(q.lower())
-        relevance = 1.0
-        if title_match == 0:  # Match at start of title
-            relevance = 1.0
-        elif title_match > 0:  # Match in title
-            relevance = 0.8
-        elif desc_match >= 0:  # Match iFn description
-            relevance = 0.6
-            
-        results.append(SearchResult(
-            type="topic",
-            id=str(topic["_id"]),
-            title=topic["title"],
-            description=topic.get("description", ""),
-            relevance_score=relevance
-        ))
-    
-    for tip in tip_results:
-        topic = await db.topics.find_one({"_id": tip["topic_id"]})
-        # Calculate a simple relevance score based on match position
-        title_match = tip["title"].lower().find(q.lower())
-        desc_match = tip["description"].lower().find(q.lower())
-        relevance = 1.0
-        if title_match == 0:  # Match at start of title
-            relevance = 1.0
-        elif title_match > 0:  # Match in title
-            relevance = 0.8
-        elif desc_match >= 0:  # Match iFn description
-            relevance = 0.6
-            
-        results.append(SearchResult(
-            type="tip",
-            id=str(tip["_id"]),
-            title=tip["title"],
-            description=tip["description"],
-            topic_id=str(tip["topic_id"]),
-            topic_title=topic["title"] if topic else None,
-            relevance_score=relevance
-        ))
-    
-    # Sort by relevance score
-    results.sort(key=lambda x: x.relevance_score, reverse=True)
-    
-    # Get total count
-    total_count = len(results)
-    
-    return SearchResponse(
-        results=results,
-        total_count=total_count,
-        query=q,
-        limit=limit,
-        offset=offset
-    )
+    # A single aggregation searches topics, unions in the tip matches, ranks both by
+    # text score and returns the requested page, with parent topic titles joined in,
+    # together with the total match count
+    text_match = {"$match": {"$text": {"$search": q}}}
+    pipeline = [
+        text_match,
+        # Keep only the fields a SearchResult is built from
+        {"$project": {
+            "title": 1,
+            "description": 1,
+            "type": {"$literal": "topic"},
+            "score": {"$meta": "textScore"},
+        }},
+        {"$unionWith": {
+            "coll": "tips",
+            "pipeline": [
+                text_match,
+                {"$project": {
+                    "title": 1,
+                    "description": 1,
+                    "topic_id": 1,
+                    "type": {"$literal": "tip"},
+                    "score": {"$meta": "textScore"},
+                }},
+            ],
+        }},
+        {"$sort": {"score": -1, "_id": 1}},  # _id keeps equal scores in a stable order across pages
+        {"$facet": {
+            "data": [
+                {"$skip": offset},
+                {"$limit": limit},
+                # Join parent topic titles for the tips on this page only
+                {"$lookup": {
+                    "from": "topics",
+                    "let": {"topic_id": "$topic_id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$topic_id", "$$topic_id"]}}},
+                        {"$project": {"_id": 0, "title": 1}},
+                    ],
+                    "as": "parent",
+                }},
+                {"$addFields": {"topic_title": {"$cond": [
+                    {"$eq": ["$type", "tip"]},
+                    {"$arrayElemAt": ["$parent.title", 0]},
+                    None,
+                ]}}},
+                {"$project": {"parent": 0}},
+            ],
+            "total": [{"$count": "n"}],
+        }},
+    ]
+    cursor = await db.topics.aggregate(pipeline)
+    (page,) = await cursor.to_list(length=1)
+    matches = page["data"]
+    total_count = page["total"][0]["n"] if page["total"] else 0
+
+    # Every field comes straight from the database, so the payload is encoded as-is
+    # instead of being built into SearchResult models and validated again by FastAPI;
+    # it has the same shape as SearchResponse
+    results = [
+        {
+            "type": doc["type"],
+            "id": str(doc["_id"]),
+            "title": doc["title"],
+            "description": doc.get("description") or "",
+            "topic_id": str(doc["topic_id"]) if doc["type"] == "tip" else None,
+            "topic_title": doc.get("topic_title"),
+            "relevance_score": doc["score"],
+        }
+        for doc in matches
+    ]
+
+    return ORJSONResponse({
+        "results": results,
+        "total_count": total_count,
+        "query": q,
+        "limit": limit,
+        "offset": offset
+    })
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),  # One per CPU unless overridden
+        loop="auto",  # uvloop/httptools when installed, asyncio/h11 otherwise
+        http="auto",
+        log_level="warning"
+    ) 
\ No newline at end of file